@@ -7,16 +7,23 @@ Script : sync_activities_to_sheets.py
 Synchronise automatiquement les fichiers JSON Garmin avec une feuille Google Sheets
 (« Global activity details »). Pour chaque activité, la paire
 activity_<ID>.json + activity_details_<ID>.json est fusionnée et importée.
-Ajout de logs de debug, vérification d'existence de répertoire, et pause finale.
+Ajout de logs de debug, vérification d'existence de répertoire, et pause finale
+(uniquement en console interactive ; désactivable avec --no-pause).
 """
 
-import os
-import glob
 import json
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Any
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import gspread
+import ijson
+import orjson
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # ===========================
 # Configuration à adapter
@@ -27,22 +34,19 @@ WORKSHEET_NAME   = "Global activity details"
 # Chemin corrigé : utiliser slash ou raw string avec une seule paire de backslashes
 ACTIVITIES_DIR   = "C:/Users/loys_/HealthData/FitFiles/Activities"
 CHUNK_SIZE       = 100
-
-HEADERS: List[str] = [
-    "activityId", "activityName", "activityTypeId", "parentActivityTypeId",
-    "eventTypeId", "manualActivity", "favorite", "personalRecord",
-    "startTimeLocal", "startTimeGMT", "activityTimestampMs", "duration",
-    "movingDuration", "elapsedDuration", "timezoneOffset",
-    "distance", "averageSpeed", "maxSpeed", "averageStrideLength",
-    "averagePaceMinPerKm", "totalElevationGain", "totalElevationLoss",
-    "minElevation", "maxElevation", "startLatitude", "startLongitude",
-    "endLatitude", "endLongitude", "averageHeartRate", "maxHeartRate",
-    "averageCadence", "maxCadence", "totalSteps", "vo2MaxValue",
-    "activeKilocalories", "bmrKilocalories", "bodyBatteryDelta",
-    "hrZone1Seconds", "hrZone2Seconds", "hrZone3Seconds", "hrZone4Seconds",
-    "hrZone5Seconds", "moderateIntensityMinutes", "vigorousIntensityMinutes",
-    "hydrationConsumedMl", "splitsJSON"
-]
+MAX_WORKERS      = 16
+# Au-delà de ce volume de fichiers détails à analyser, un processus par cœur plutôt que des threads
+PROCESS_POOL_BYTES = 200 * 1024 * 1024
+# Limite Google Sheets du nombre de caractères par cellule
+MAX_CELL_LENGTH  = 50000
+# Cache local des IDs déjà synchronisés (supprimer le fichier pour forcer une relecture complète)
+SYNCED_IDS_FILE  = os.path.join(os.path.dirname(CREDENTIALS_FILE), ".synced_ids.json")
+# Cache local des lignes déjà construites, invalidé par la date de modification des fichiers
+ROWS_CACHE_FILE  = os.path.join(os.path.dirname(CREDENTIALS_FILE), ".rows_cache.json")
+# Au-delà de cette taille de requête, repli sur des appends par paquets
+MAX_BATCH_BYTES  = 10 * 1024 * 1024
+# Au-delà de cette taille, activity_details_*.json est lu en flux (seules les clés utiles sont construites)
+DETAILS_STREAM_BYTES = 4 * 1024 * 1024
 
 # ---------------------------------------------------------------------------
 # Calculs de champs dérivés
@@ -56,163 +60,348 @@ def compute_pace_min_per_km(avg_speed_m_s: float) -> Any:
         return round(pace_sec / 60, 2)
     return ""
 
-# ---------------------------------------------------------------------------
-# Fusion des deux JSON pour extraire tous les champs
-# ---------------------------------------------------------------------------
-def merge_data(details: dict, flat: dict) -> dict:
-    start_local = details['summaryDTO']['startTimeLocal']
-    start_gmt   = details['summaryDTO']['startTimeGMT']
-    tz_offset_h = (
+def compute_tz_offset_h(start_local: str, start_gmt: str) -> float:
+    return (
         datetime.fromisoformat(start_local)
         - datetime.fromisoformat(start_gmt)
     ).total_seconds() / 3600
 
-    return {
-        "activityId":           details["activityId"],
-        "activityName":         details["activityName"],
-        "activityTypeId":       details["activityTypeDTO"]["typeId"],
-        "parentActivityTypeId": details["activityTypeDTO"]["parentTypeId"],
-        "eventTypeId":          details["eventTypeDTO"]["typeId"],
-        "manualActivity":       details["metadataDTO"]["manualActivity"],
-        "favorite":             details["metadataDTO"]["favorite"],
-        "personalRecord":       details["metadataDTO"]["personalRecord"],
-        "startTimeLocal":       start_local,
-        "startTimeGMT":         start_gmt,
-        "activityTimestampMs":  flat.get("beginTimestamp"),
-        "timezoneOffset":       tz_offset_h,
-        "duration":             details["summaryDTO"]["duration"],
-        "movingDuration":       details["summaryDTO"]["movingDuration"],
-        "elapsedDuration":      details["summaryDTO"]["elapsedDuration"],
-        "distance":             details["summaryDTO"]["distance"],
-        "averageSpeed":         details["summaryDTO"]["averageSpeed"],
-        "maxSpeed":             details["summaryDTO"]["maxSpeed"],
-        "totalSteps":           details["summaryDTO"]["steps"],
-        "totalElevationGain":   details["summaryDTO"]["elevationGain"],
-        "totalElevationLoss":   details["summaryDTO"]["elevationLoss"],
-        "minElevation":         details["summaryDTO"]["minElevation"],
-        "maxElevation":         details["summaryDTO"]["maxElevation"],
-        "startLatitude":        details["summaryDTO"]["startLatitude"],
-        "startLongitude":       details["summaryDTO"]["startLongitude"],
-        "endLatitude":          details["summaryDTO"]["endLatitude"],
-        "endLongitude":         details["summaryDTO"]["endLongitude"],
-        "averageHeartRate":     details["summaryDTO"]["averageHR"],
-        "maxHeartRate":         details["summaryDTO"]["maxHR"],
-        "averageCadence":       details["summaryDTO"]["averageRunCadence"],
-        "maxCadence":           details["summaryDTO"]["maxRunCadence"],
-        "vo2MaxValue":          flat.get("vO2MaxValue"),
-        "activeKilocalories":   details["summaryDTO"]["calories"],
-        "bmrKilocalories":      details["summaryDTO"]["bmrCalories"],
-        "bodyBatteryDelta":     details["summaryDTO"]["differenceBodyBattery"],
-        "hrZone1Seconds":       flat.get("hrTimeInZone_1"),
-        "hrZone2Seconds":       flat.get("hrTimeInZone_2"),
-        "hrZone3Seconds":       flat.get("hrTimeInZone_3"),
-        "hrZone4Seconds":       flat.get("hrTimeInZone_4"),
-        "hrZone5Seconds":       flat.get("hrTimeInZone_5"),
-        "moderateIntensityMinutes": details["summaryDTO"]["moderateIntensityMinutes"],
-        "vigorousIntensityMinutes": details["summaryDTO"]["vigorousIntensityMinutes"],
-        "hydrationConsumedMl":      details["summaryDTO"]["waterEstimated"],
-        "splitsJSON":               details.get("splitSummaries", [])
-    }
-
-# ---------------------------------------------------------------------------
-# Construction de la ligne à injecter dans Sheets
-# ---------------------------------------------------------------------------
-def build_row(data: dict) -> List[Any]:
-    stride = compute_stride_length(data.get("distance", 0), data.get("totalSteps", 0))
-    pace   = compute_pace_min_per_km(data.get("averageSpeed", 0))
-    splits = json.dumps(data.get("splitsJSON", []))
-    return [
-        data["activityId"], data["activityName"], data["activityTypeId"],
-        data["parentActivityTypeId"], data["eventTypeId"], data["manualActivity"],
-        data["favorite"], data["personalRecord"], data["startTimeLocal"],
-        data["startTimeGMT"], data["activityTimestampMs"], data["duration"],
-        data["movingDuration"], data["elapsedDuration"], data["timezoneOffset"],
-        data["distance"], data["averageSpeed"], data["maxSpeed"],
-        stride, pace, data["totalElevationGain"], data["totalElevationLoss"],
-        data["minElevation"], data["maxElevation"], data["startLatitude"],
-        data["startLongitude"], data["endLatitude"], data["endLongitude"],
-        data["averageHeartRate"], data["maxHeartRate"], data["averageCadence"],
-        data["maxCadence"], data["totalSteps"], data["vo2MaxValue"],
-        data["activeKilocalories"], data["bmrKilocalories"], data["bodyBatteryDelta"],
-        data["hrZone1Seconds"], data["hrZone2Seconds"], data["hrZone3Seconds"],
-        data["hrZone4Seconds"], data["hrZone5Seconds"],
-        data["moderateIntensityMinutes"], data["vigorousIntensityMinutes"],
-        data["hydrationConsumedMl"], splits
-    ]
+# ---------------------------------------------------------------------------
+# Colonnes de la feuille : (en-tête, extraction depuis summaryDTO / details / flat)
+# ---------------------------------------------------------------------------
+# ⚠️ Toute nouvelle clé de premier niveau lue dans `d` doit aussi être ajoutée à
+# DETAILS_KEYS : les gros fichiers détails (lus en flux) ne contiennent que ces clés.
+EXTRACTORS: Tuple[Tuple[str, Callable[[dict, dict, dict], Any]], ...] = (
+    ("activityId",           lambda s, d, f: d["activityId"]),
+    ("activityName",         lambda s, d, f: d["activityName"]),
+    ("activityTypeId",       lambda s, d, f: d["activityTypeDTO"]["typeId"]),
+    ("parentActivityTypeId", lambda s, d, f: d["activityTypeDTO"]["parentTypeId"]),
+    ("eventTypeId",          lambda s, d, f: d["eventTypeDTO"]["typeId"]),
+    ("manualActivity",       lambda s, d, f: d["metadataDTO"]["manualActivity"]),
+    ("favorite",             lambda s, d, f: d["metadataDTO"]["favorite"]),
+    ("personalRecord",       lambda s, d, f: d["metadataDTO"]["personalRecord"]),
+    ("startTimeLocal",       lambda s, d, f: s["startTimeLocal"]),
+    ("startTimeGMT",         lambda s, d, f: s["startTimeGMT"]),
+    ("activityTimestampMs",  lambda s, d, f: f.get("beginTimestamp")),
+    ("duration",             lambda s, d, f: s["duration"]),
+    ("movingDuration",       lambda s, d, f: s["movingDuration"]),
+    ("elapsedDuration",      lambda s, d, f: s["elapsedDuration"]),
+    ("timezoneOffset",       lambda s, d, f: compute_tz_offset_h(s["startTimeLocal"], s["startTimeGMT"])),
+    ("distance",             lambda s, d, f: s["distance"]),
+    ("averageSpeed",         lambda s, d, f: s["averageSpeed"]),
+    ("maxSpeed",             lambda s, d, f: s["maxSpeed"]),
+    ("averageStrideLength",  lambda s, d, f: compute_stride_length(s["distance"], s["steps"])),
+    ("averagePaceMinPerKm",  lambda s, d, f: compute_pace_min_per_km(s["averageSpeed"])),
+    ("totalElevationGain",   lambda s, d, f: s["elevationGain"]),
+    ("totalElevationLoss",   lambda s, d, f: s["elevationLoss"]),
+    ("minElevation",         lambda s, d, f: s["minElevation"]),
+    ("maxElevation",         lambda s, d, f: s["maxElevation"]),
+    ("startLatitude",        lambda s, d, f: s["startLatitude"]),
+    ("startLongitude",       lambda s, d, f: s["startLongitude"]),
+    ("endLatitude",          lambda s, d, f: s["endLatitude"]),
+    ("endLongitude",         lambda s, d, f: s["endLongitude"]),
+    ("averageHeartRate",     lambda s, d, f: s["averageHR"]),
+    ("maxHeartRate",         lambda s, d, f: s["maxHR"]),
+    ("averageCadence",       lambda s, d, f: s["averageRunCadence"]),
+    ("maxCadence",           lambda s, d, f: s["maxRunCadence"]),
+    ("totalSteps",           lambda s, d, f: s["steps"]),
+    ("vo2MaxValue",          lambda s, d, f: f.get("vO2MaxValue")),
+    ("activeKilocalories",   lambda s, d, f: s["calories"]),
+    ("bmrKilocalories",      lambda s, d, f: s["bmrCalories"]),
+    ("bodyBatteryDelta",     lambda s, d, f: s["differenceBodyBattery"]),
+    ("hrZone1Seconds",       lambda s, d, f: f.get("hrTimeInZone_1")),
+    ("hrZone2Seconds",       lambda s, d, f: f.get("hrTimeInZone_2")),
+    ("hrZone3Seconds",       lambda s, d, f: f.get("hrTimeInZone_3")),
+    ("hrZone4Seconds",       lambda s, d, f: f.get("hrTimeInZone_4")),
+    ("hrZone5Seconds",       lambda s, d, f: f.get("hrTimeInZone_5")),
+    ("moderateIntensityMinutes", lambda s, d, f: s["moderateIntensityMinutes"]),
+    ("vigorousIntensityMinutes", lambda s, d, f: s["vigorousIntensityMinutes"]),
+    ("hydrationConsumedMl",      lambda s, d, f: s["waterEstimated"]),
+    ("splitsJSON",               lambda s, d, f: orjson.dumps(
+        d.get("splitSummaries", [])).decode()[:MAX_CELL_LENGTH]),
+)
+
+HEADERS: List[str] = [name for name, _ in EXTRACTORS]
+_EXTRACT_FNS = tuple(extract for _, extract in EXTRACTORS)
+
+# Clé de format du cache des lignes : incrémenter la version si une extraction change
+ROWS_CACHE_VERSION = 1
+ROWS_CACHE_SCHEMA  = f"{ROWS_CACHE_VERSION}:" + ",".join(HEADERS)
+
+# Clés de premier niveau de activity_details_*.json utilisées par EXTRACTORS
+# (à tenir à jour avec EXTRACTORS : seules ces clés sont construites en lecture par flux)
+DETAILS_KEYS = frozenset({
+    "activityId", "activityName", "activityTypeDTO", "eventTypeDTO",
+    "metadataDTO", "summaryDTO", "splitSummaries",
+})
+
+# ---------------------------------------------------------------------------
+# Construction de la ligne à injecter dans Sheets (une seule passe)
+# ---------------------------------------------------------------------------
+def build_row(details: dict, flat: dict) -> List[Any]:
+    summary = details["summaryDTO"]
+    return [extract(summary, details, flat) for extract in _EXTRACT_FNS]
+
+# ---------------------------------------------------------------------------
+# Lecture d'une paire de fichiers (exécutée en parallèle)
+# ---------------------------------------------------------------------------
+_print_lock = threading.Lock()
+
+def open_sequential(path: str):
+    # Windows : FILE_FLAG_SEQUENTIAL_SCAN (via O_SEQUENTIAL) pour une lecture anticipée plus agressive
+    if os.name == "nt":
+        fd = os.open(path, os.O_RDONLY | os.O_BINARY | os.O_SEQUENTIAL)
+        return os.fdopen(fd, 'rb', buffering=1 << 20)
+    return open(path, 'rb')
+
+
+def load_details(path: str) -> dict:
+    with open_sequential(path) as f:
+        if os.fstat(f.fileno()).st_size < DETAILS_STREAM_BYTES:
+            return orjson.loads(f.read())
+        # Gros fichier : on ignore les tableaux de métriques sans les matérialiser
+        out, key, builder = {}, None, None
+        for prefix, event, value in ijson.parse(f, use_float=True):
+            if prefix == "":
+                if builder is not None:
+                    out[key] = builder.value
+                    builder = None
+                if event == "map_key" and value in DETAILS_KEYS:
+                    key, builder = value, ijson.ObjectBuilder()
+            elif builder is not None:
+                builder.event(event, value)
+        return out
+
+
+def process_activity(aid: str, flat_path: str, detail_path: str) -> Optional[List[Any]]:
+    try:
+        with open_sequential(flat_path) as f:
+            flat    = orjson.loads(f.read())
+        details = load_details(detail_path)
+        return build_row(details, flat)
+    except Exception as e:
+        with _print_lock:
+            print(f"⚠️ Erreur activité {aid} : {e}")
+        return None
+
+
+def load_rows_cache() -> Dict[str, list]:
+    try:
+        with open(ROWS_CACHE_FILE, 'rb') as f:
+            cache = orjson.loads(f.read())
+    except (OSError, ValueError):
+        return {}
+    # Lignes construites avec un autre jeu de colonnes : inutilisables
+    if not isinstance(cache, dict) or cache.get("schema") != ROWS_CACHE_SCHEMA:
+        return {}
+    return cache.get("rows", {})
+
+
+def save_rows_cache(cache: Dict[str, list]) -> None:
+    with open(ROWS_CACHE_FILE, 'wb') as f:
+        f.write(orjson.dumps({"schema": ROWS_CACHE_SCHEMA, "rows": cache}))
+
+
+def parse_activities(todo: List[str], flat_paths: Dict[str, str],
+                     detail_paths: Dict[str, str]) -> Dict[str, List[Any]]:
+    # Réutilise la ligne en cache si aucun des deux fichiers n'a été modifié.
+    # Seules les activités encore à ajouter sont conservées : une fois dans la feuille,
+    # elles sortent de todo et leur ligne ne serait plus jamais relue.
+    pending = set(todo)
+    cache = {aid: entry for aid, entry in load_rows_cache().items() if aid in pending}
+    rows, stamps, to_parse, detail_bytes = {}, {}, [], 0
+    for aid in todo:
+        detail_stat = os.stat(detail_paths[aid])
+        stamp = [os.stat(flat_paths[aid]).st_mtime_ns, detail_stat.st_mtime_ns]
+        cached = cache.get(aid)
+        if cached is not None and cached[:2] == stamp:
+            rows[aid] = cached[2]
+        else:
+            stamps[aid] = stamp
+            to_parse.append(aid)
+            detail_bytes += detail_stat.st_size
+    print(f"DEBUG ▶ {len(rows)} lignes reprises du cache, {len(to_parse)} à analyser")
+
+    # Seule la ligne construite (quelques Ko) repasse par pickle, jamais le JSON brut
+    if detail_bytes > PROCESS_POOL_BYTES:
+        executor = ProcessPoolExecutor(max_workers=None)
+    else:
+        executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+    with executor as pool:
+        results = pool.map(
+            process_activity,
+            to_parse,
+            [flat_paths[aid] for aid in to_parse],
+            [detail_paths[aid] for aid in to_parse],
+            chunksize=8,
+        )
+        for aid, row in zip(to_parse, results):
+            if row is not None:
+                rows[aid] = row
+                cache[aid] = [*stamps[aid], row]
+
+    save_rows_cache(cache)
+    return rows
 
 # ---------------------------------------------------------------------------
 # Google Sheets : chargement et gestion des en-têtes
 # ---------------------------------------------------------------------------
 def load_worksheet():
     gc = gspread.service_account(filename=CREDENTIALS_FILE)
+    # Connexions réutilisées + nouvelles tentatives avec backoff (429 / 5xx, coupures réseau).
+    # Les POST (écritures) ne sont rejoués qu'en cas d'échec de connexion, pour éviter les doublons.
+    gc.http_client.session.mount("https://", HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=32,
+        max_retries=Retry(total=5, backoff_factor=0.5,
+                          status_forcelist=(429, 500, 502, 503, 504)),
+    ))
     sh = gc.open_by_key(SPREADSHEET_ID)
     try:
         ws = sh.worksheet(WORKSHEET_NAME)
     except gspread.exceptions.WorksheetNotFound:
-        ws = sh.add_worksheet(title=WORKSHEET_NAME, rows="2000", cols=str(len(HEADERS)))
+        # Une seule ligne (en-têtes) : les ajouts agrandissent la grille, et row_count reste fiable
+        ws = sh.add_worksheet(title=WORKSHEET_NAME, rows=1, cols=len(HEADERS))
     if not ws.row_values(1):
-        ws.append_row(HEADERS, value_input_option="USER_ENTERED")
+        ws.append_row(HEADERS, value_input_option="RAW")
     return ws
 
 
-def get_existing_ids(ws) -> set:
-    return set(ws.col_values(1)[1:])
+# ---------------------------------------------------------------------------
+# IDs déjà présents : cache local + lecture des seules lignes ajoutées depuis
+# ---------------------------------------------------------------------------
+def normalize_id(value: Any) -> str:
+    # UNFORMATTED_VALUE renvoie des nombres : 1.2345678901E10 doit redevenir "12345678901",
+    # comme le nom de fichier (vaut aussi pour les IDs déjà mis en cache sous la forme "….0")
+    text = str(value)
+    if text.isdigit():
+        return text
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return text
+    return str(int(number)) if number.is_integer() else text
+
+
+def load_synced_ids() -> Tuple[int, set]:
+    try:
+        with open(SYNCED_IDS_FILE, 'rb') as f:
+            cache = orjson.loads(f.read())
+        return cache["lastRow"], {normalize_id(v) for v in cache["ids"]}
+    except (OSError, ValueError, KeyError):
+        return 1, set()
+
+
+def save_synced_ids(last_row: int, ids: set) -> None:
+    with open(SYNCED_IDS_FILE, 'wb') as f:
+        f.write(orjson.dumps({"lastRow": last_row, "ids": sorted(ids)}))
+
+
+def get_existing_ids(ws, last_row: int, ids: set) -> Tuple[int, set]:
+    # Grille plus courte que le cache : feuille recréée ou lignes supprimées, on relit tout
+    if ws.row_count < last_row:
+        last_row, ids = 1, set()
+    ids = set(ids)
+    # Aucune ligne au-delà de celles déjà connues (ex. feuille tout juste créée) : pas d'appel API
+    if ws.row_count <= last_row:
+        return last_row, ids
+    resp = ws.spreadsheet.values_get(
+        f"'{WORKSHEET_NAME}'!A{last_row + 1}:A",
+        params={"valueRenderOption": "UNFORMATTED_VALUE", "majorDimension": "COLUMNS"},
+    )
+    column = resp.get("values", [[]])[0]
+    ids.update(normalize_id(v) for v in column if v != "")
+    return last_row + len(column), ids
+
+# ---------------------------------------------------------------------------
+# Google Sheets : ajout des nouvelles lignes en une seule requête
+# ---------------------------------------------------------------------------
+def to_cell(value: Any) -> dict:
+    if value is None or value == "":
+        return {}
+    if isinstance(value, bool):
+        return {"userEnteredValue": {"boolValue": value}}
+    if isinstance(value, (int, float)):
+        return {"userEnteredValue": {"numberValue": value}}
+    return {"userEnteredValue": {"stringValue": str(value)}}
+
+
+def append_rows_batched(ws, rows: List[List[Any]]) -> None:
+    body = {"requests": [{"appendCells": {
+        "sheetId": ws.id,
+        "rows":    [{"values": [to_cell(v) for v in row]} for row in rows],
+        "fields":  "userEnteredValue",
+    }}]}
+    # Taille mesurée comme requests l'enverra (json.dumps : séparateurs espacés, échappement ASCII)
+    if len(json.dumps(body).encode()) <= MAX_BATCH_BYTES:
+        ws.spreadsheet.batch_update(body)
+        print(f"➕ Ajout de {len(rows)} activités en une requête…")
+        return
+
+    for i in range(0, len(rows), CHUNK_SIZE):
+        chunk = rows[i:i + CHUNK_SIZE]
+        ws.append_rows(chunk, value_input_option="RAW")
+        print(f"➕ Ajout de {len(chunk)} activités…")
 
 # ---------------------------------------------------------------------------
 # Exécution principale
 # ---------------------------------------------------------------------------
 def main() -> None:
     try:
-        ws = load_worksheet()
-        known_ids = get_existing_ids(ws)
-        print(f"✅ {len(known_ids)} activités déjà présentes dans la feuille.")
-
         # Debug: existence et contenu du répertoire
         print("DEBUG ▶ ACTIVITIES_DIR exists:", os.path.isdir(ACTIVITIES_DIR))
-        flat_files   = glob.glob(os.path.join(ACTIVITIES_DIR, "activity_*.json"))
-        detail_files = glob.glob(os.path.join(ACTIVITIES_DIR, "activity_details_*.json"))
-        print("DEBUG ▶ flat files   =", flat_files)
-        print("DEBUG ▶ detail files =", detail_files)
 
-        # IDs communs
-        get_id     = lambda p: os.path.splitext(os.path.basename(p))[0].rsplit("_", 1)[1]
-        common_ids = sorted({get_id(f) for f in flat_files} & {get_id(f) for f in detail_files})
-        print("DEBUG ▶ common activity IDs =", common_ids)
+        # Un seul parcours du répertoire : classement par préfixe, ID par découpage
+        flat_paths, detail_paths = {}, {}
+        for entry in os.scandir(ACTIVITIES_DIR):
+            name = entry.name
+            if not name.endswith(".json"):
+                continue
+            if name.startswith("activity_details_"):
+                detail_paths[name[17:-5]] = entry.path
+            elif name.startswith("activity_"):
+                flat_paths[name[9:-5]] = entry.path
+        print("DEBUG ▶ flat files   =", len(flat_paths))
+        print("DEBUG ▶ detail files =", len(detail_paths))
 
-        if not common_ids:
+        paired_ids = set(flat_paths) & set(detail_paths)
+        if not paired_ids:
             print("⚠️ Aucun fichier JSON pair trouvé. Vérifiez ACTIVITIES_DIR et le nommage.")
             return
 
-        new_rows, added = [], 0
-        for aid in common_ids:
-            if aid in known_ids:
-                continue
-            print(f"Traitement de l'activité {aid}...")
-            try:
-                with open(os.path.join(ACTIVITIES_DIR, f"activity_{aid}.json"), 'r', encoding='utf-8') as f:
-                    flat    = json.load(f)
-                with open(os.path.join(ACTIVITIES_DIR, f"activity_details_{aid}.json"), 'r', encoding='utf-8') as f:
-                    details = json.load(f)
-                merged = merge_data(details, flat)
-                new_rows.append(build_row(merged))
-                added += 1
-            except Exception as e:
-                print(f"⚠️ Erreur activité {aid} : {e}")
-
-            if len(new_rows) >= CHUNK_SIZE:
-                ws.append_rows(new_rows, value_input_option="USER_ENTERED")
-                print(f"➕ Ajout de {len(new_rows)} activités…")
-                new_rows = []
+        # Tout est déjà synchronisé d'après le cache local : inutile d'ouvrir la feuille
+        last_row, cached_ids = load_synced_ids()
+        if paired_ids <= cached_ids:
+            print("✅ Aucune nouvelle activité à synchroniser.")
+            return
+
+        ws = load_worksheet()
+        last_row, known_ids = get_existing_ids(ws, last_row, cached_ids)
+        print(f"✅ {len(known_ids)} activités déjà présentes dans la feuille.")
+
+        # IDs communs, en excluant d'emblée ceux déjà présents dans la feuille
+        todo = sorted(paired_ids - known_ids)
+        print("DEBUG ▶ new activity IDs =", todo)
+        if not todo:
+            save_synced_ids(last_row, known_ids)
+            print("✅ Aucune nouvelle activité à synchroniser.")
+            return
+
+        print(f"Traitement de {len(todo)} activités...")
+        rows = parse_activities(todo, flat_paths, detail_paths)
+        new_rows = [rows[aid] for aid in todo if aid in rows]
+        synced = set(rows)
 
         if new_rows:
-            ws.append_rows(new_rows, value_input_option="USER_ENTERED")
-            print(f"➕ Ajout final de {len(new_rows)} activités…")
+            append_rows_batched(ws, new_rows)
+        save_synced_ids(last_row + len(new_rows), known_ids | synced)
 
-        print(f"🎉 Terminé : {added} nouvelles activités ajoutées.")
+        print(f"🎉 Terminé : {len(synced)} nouvelles activités ajoutées.")
     except Exception as ex:
         print(f"💥 Erreur inattendue : {ex}")
     finally:
-        input("Appuyez sur Entrée pour quitter...")
+        if sys.stdin.isatty() and "--no-pause" not in sys.argv:
+            input("Appuyez sur Entrée pour quitter...")
 
 if __name__ == "__main__":
     main()